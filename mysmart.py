@@ -7,6 +7,7 @@ Data will be written to an Excel spreadsheet located under the working directory
 
 
 import datetime
+import json
 import os
 import re
 import smartsheet
@@ -44,6 +45,20 @@ NEBS_WORKSPACE_IDS = [4792839738550148,   # NEBS Project Status
 # NEBS_WORKSPACE_IDS = [1043569512343428]  # Archived Projects
 SG_WORKSPACE_IDS = [3517256463345540]     # IoT Project Status
 
+# Report spanning the NEBS project sheets, used instead of downloading every project sheet.
+# The API cannot create reports, build it in Smartsheet with:
+#   - the NEBS workspaces as source
+#   - no filter, sort or grouping, so every row of each project sheet is included in the sheet's order
+#   - the Start, Finish and Standard Section No. columns
+# Leave as None to download every project sheet.
+NEBS_REPORT_ID = None
+
+# Sheet inventory (sheet id -> workspace, name, version, owner, modifiedAt) and the status of each
+# sheet, kept between runs so unchanged sheets are not downloaded again.
+# Stored with the Excel results since it contains sheet names and owner e-mail addresses.
+NEBS_SHEET_INDEX_FILE = os.path.dirname(os.path.abspath(__file__)) + os.sep + "Results" + os.sep + "NEBS_sheet_index.json"
+SG_SHEET_INDEX_FILE = os.path.dirname(os.path.abspath(__file__)) + os.sep + "Results" + os.sep + "SG_sheet_index.json"
+
 
 def get_workspaces(ss_client):
     """
@@ -57,27 +72,17 @@ def get_workspaces(ss_client):
 
 
 # Returns a workspace object
-def get_workspace_by_id(ss_client, w_id):
+def get_workspace_by_id(ss_client, w_id, load_all=True):
     """
     Returns the Workspace object given its id.
 
     :param ss_client: Access Token
     :param w_id:
+    :param bool load_all: False to only populate the top level sheets and folders, which is much lighter.
     :return:
     """
     # Returns a workspace object with all sheets information populated
-    return ss_client.Workspaces.get_workspace(w_id, load_all=True, include=["ownerInfo", "source"])
-
-
-# Returns an array of sheet ids
-def get_sheets_from_workspace(ws):
-    arr = []  # temporary array of sheet ids
-    ws_sheets = ws.sheets  # Array of Sheet objects
-
-    if len(ws.sheets) > 0:
-        for ws_sheet in ws.sheets:
-            arr.append(ws_sheet.id)
-    return arr
+    return ss_client.Workspaces.get_workspace(w_id, load_all=load_all, include=["ownerInfo", "source"])
 
 
 # Returns a Sheet object given a Sheet id
@@ -103,17 +108,210 @@ def get_sheet_by_id(ss, s_id):
 
 
 # Returns all Sheets accessible by user
-def get_all_sheets(ss):
+def get_all_sheets(ss, include=None):
     """
     Lists all the Sheets accessible by user.
 
     :param ss: Access Token
+    :param list include: Optional elements to include in each Sheet (e.g. "sheetVersion")
     :return:
     """
-    response = ss.Sheets.list_sheets(include_all=True)
+    response = ss.Sheets.list_sheets(include=include, include_all=True)
     return response.data
 
 
+def load_sheet_index(path):
+    """
+    Loads the sheet index saved by a previous run.
+
+    :param str path: Location of the index file
+    :return: Dictionary with the sheet id keyed inventory.
+             An empty index is returned if the file does not exist or cannot be read.
+    :rtype: dict
+    """
+    index = {"sheets": {}}
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+        sheets = {}
+        # JSON keys are always strings, convert them back to sheet ids.
+        for s_id, entry in saved["sheets"].items():
+            if not isinstance(entry, dict) or "workspace_id" not in entry:
+                raise ValueError("malformed entry for sheet {}".format(s_id))
+            status = entry.get("status")
+            if status is not None and (not isinstance(status, dict) or
+                                       not set(["version", "results", "completion"]) <= set(status)):
+                raise ValueError("malformed status for sheet {}".format(s_id))
+            sheets[int(s_id)] = entry
+        index["sheets"] = sheets
+    except (IOError, ValueError, KeyError, TypeError, AttributeError) as e:
+        logger.debug("load_sheet_index: starting with an empty index ({})".format(e))
+    return index
+
+
+def save_sheet_index(index, path):
+    """
+    Saves the sheet index for the next run.
+
+    :param dict index: Index returned by build_sheet_index()
+    :param str path: Location of the index file
+    """
+    index_dir = os.path.dirname(path)
+    if index_dir and not os.path.isdir(index_dir):
+        os.makedirs(index_dir)
+    with open(path, "w") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+
+
+def build_sheet_index(ss_client, workspace_ids, path=None):
+    """
+    Builds an inventory of the sheets at the top level of the workspaces:
+        sheet id -> workspace_id, position, name, version, owner, modified_at
+
+    The workspace membership is read on every run from the top level of each workspace (no load_all),
+    so sheets moved to another workspace (e.g. Archived Projects) drop out of the report.  The version
+    comes from a single paginated get_all_sheets() call.  The status saved by a previous run is kept
+    so generate_dataframe_from_workspace() can skip the sheets whose version has not changed.
+
+    :param Smartsheet ss_client: base client object
+    :param list workspace_ids: Workspace ids to be indexed
+    :param str path: Location of the index saved by a previous run, None to start from scratch
+    :return: Dictionary with the sheet id keyed inventory
+    :rtype: dict
+    """
+    previous = {}
+    if path is not None:
+        previous = load_sheet_index(path)["sheets"]
+
+    sheets = {}
+    for w_id in workspace_ids:
+        ws = get_workspace_by_id(ss_client, w_id, load_all=False)
+        for ws_sheet in ws.sheets:
+            entry = previous.get(ws_sheet.id, {})
+            entry["workspace_id"] = w_id
+            entry["position"] = len(sheets)  # Keeps the workspace listing order
+            entry["name"] = ws_sheet.name
+            entry["owner"] = getattr(ws_sheet, "owner", None)
+            entry["version"] = None
+            sheets[ws_sheet.id] = entry
+
+    for sh in get_all_sheets(ss_client, include=["sheetVersion"]):
+        if sh.id in sheets:
+            entry = sheets[sh.id]
+            entry["version"] = sh.version
+            entry["modified_at"] = str(sh.modified_at) if sh.modified_at is not None else None
+    return {"sheets": sheets}
+
+
+def get_sheets_from_index(index, w_id):
+    """
+    Returns the ids of the indexed sheets belonging to a workspace, in the workspace listing order.
+
+    :param dict index: Index returned by build_sheet_index()
+    :param int w_id: Workspace id
+    :return: List of sheet ids
+    :rtype: list
+    """
+    entries = [(entry["position"], s_id) for s_id, entry in index["sheets"].items() if entry["workspace_id"] == w_id]
+    return [s_id for position, s_id in sorted(entries)]
+
+
+def get_cached_status(entry):
+    """
+    Returns the status saved for an indexed sheet if the sheet has not changed since it was saved.
+
+    :param dict entry: Index entry of the sheet
+    :return: Dictionary with "results" (sg_status() list or None) and "completion"
+             (Completion, Start Date and Last Test Date), or None if the sheet must be downloaded.
+    :rtype: dict
+    """
+    status = entry.get("status")
+    if status is not None and entry["version"] is not None and status["version"] == entry["version"]:
+        return status
+    return None
+
+
+def get_report_by_id(ss_client, r_id, page_size=1000):
+    """
+    Returns the Report object with all of its rows.
+    The API only returns one page of rows per call, so the remaining pages are merged into the first one.
+
+    :param Smartsheet ss_client: base client object
+    :param int r_id: Report id
+    :param int page_size: Number of rows per call
+    :return: Report object for that id
+    :rtype: Report
+    """
+    report = ss_client.Reports.get_report(r_id, page_size=page_size, page=1)
+    total_pages = (report.total_row_count + page_size - 1) // page_size
+    for page in range(2, total_pages + 1):
+        report_page = ss_client.Reports.get_report(r_id, page_size=page_size, page=page)
+        for row in report_page.rows:
+            report.rows.append(row)
+    logger.debug("get_report_by_id: {} rows in {} pages".format(len(report.rows), max(total_pages, 1)))
+    return report
+
+
+def summarize_report(report):
+    """
+    Groups the report rows by their source sheet so the project sheets do not need to be downloaded.
+
+    :param Report report: Report spanning the project sheets
+    :return: Dictionary with sheet id as key and a dictionary as value holding
+             "dates": every Start/Finish date of that sheet as datetime objects
+             "rows": one dictionary per report row, in the sheet's order, with column title as key and Cell as value
+             An empty dictionary is returned if the report is missing rows.
+    :rtype: dict
+    """
+    if len(report.rows) < report.total_row_count:
+        logger.warning("summarize_report: only {} of {} rows, not using the report".format(
+                       len(report.rows), report.total_row_count))
+        return {}
+
+    # Report cells refer to the report's virtual column ids instead of the sheet column ids.
+    col_map = {}
+    for col in report.columns:
+        col_map[col.virtual_id] = col.title
+
+    summary = {}
+    for row in report.rows:
+        entry = summary.setdefault(row.sheet_id, {"dates": [], "rows": []})
+        row_cells = {}
+        for cell in row.cells:
+            title = col_map.get(cell.virtual_column_id)
+            if title == "Start" or title == "Finish":
+                str_to_date(cell.value, entry["dates"])
+            elif title is not None:
+                row_cells[title] = cell
+        entry["rows"].append(row_cells)
+    logger.debug("summarize_report: {} sheets covered".format(len(summary)))
+    return summary
+
+
+def report_status(summary, sheet_id, column_name, row_number):
+    """
+    Returns the completion, start date and last test date of a sheet from the report summary.
+    Report rows only carry their position in the report, so the row number is counted within the sheet's rows.
+    The report must contain every row of the sheet, unsorted, otherwise the values are not the sheet's.
+
+    :param dict summary: Summary returned by summarize_report()
+    :param int sheet_id: Project sheet id
+    :param str column_name: Column where the completion percentage is located
+    :param int row_number: Row number where the completion percentage is located (min 1)
+    :return: A list containing Completion, Start Date and Last Test Date,
+             or None if the report does not cover that sheet.
+    :rtype: list
+    """
+    entry = summary.get(sheet_id)
+    if entry is None or len(entry["rows"]) < row_number or column_name not in entry["rows"][row_number - 1]:
+        return None
+
+    complete = entry["rows"][row_number - 1][column_name].display_value
+    if complete is None:
+        complete = "0%"
+    return [complete, format_test_date(entry["dates"], "min"), format_test_date(entry["dates"], "max")]
+
+
 # Display all the parameters in the Sheet object
 def show_sheet_parameters(ss, sh):
     print("show_sheet_param: \n {}".format(sh))
@@ -361,7 +559,6 @@ def build_column_map(ss_client, sheet):
 # Returns a test date given an user provided function
 # Examples of functions could be min() or max()
 def test_date(ss_client, sheet, func):
-    date = ""
     date_arr = []
 
     # Get all the column titles from this sheet
@@ -378,6 +575,14 @@ def test_date(ss_client, sheet, func):
             finish_date = finish_date_cell.value
             date_arr = str_to_date(finish_date, date_arr)
 
+    return format_test_date(date_arr, func)
+
+
+# Returns the date picked by the user provided function in the format: mm/dd/yyyy
+# Returns an empty string when there are no dates.
+def format_test_date(date_arr, func):
+    date = ""
+
     # Find the latest date in the array which is closest to today.
     if len(date_arr) > 0:
         # date_obj = max(dt for dt in date_arr)
@@ -547,54 +752,92 @@ def generate_filename(str="", extension = '.xlsx'):
 def generate_dataframe_from_workspace(ss_client, workspace_ids, data_set,
                                       category = "NEBS",
                                       ref_sheet = None,
-                                      ref_column_map = None):
+                                      ref_column_map = None,
+                                      sheet_index = None,
+                                      report_summary = None):
 
     results_data = None
+    report_misses = 0
+
+    if sheet_index is None:
+        sheet_index = build_sheet_index(ss_client, workspace_ids)
 
     for wk_id in workspace_ids:
-        ws = get_workspace_by_id(ss_client, wk_id)
-        arr_sheet_id = get_sheets_from_workspace(ws)
+        arr_sheet_id = get_sheets_from_index(sheet_index, wk_id)
         logger.debug("generate_dataframe_from_workspace: arr_sheet = {}".format(arr_sheet_id))
 
         for i_sheet_id in arr_sheet_id:
-            sheet = get_sheet_by_id(ss_client, i_sheet_id)
-            logger.debug("generate_dataframe_from_workspace: sheet.id = {}, sheet.name = {}".format(sheet.id, sheet.name))
+            sheet_entry = sheet_index["sheets"][i_sheet_id]
+            report_data = None
             if category == "NEBS":
-                tap_num = get_tap_number(sheet.name)
-
-            if ref_sheet is not None:
-                """
-                Using the ERAT number, retrieve data from NEBS master sheet
-                results_data is list containing [Priority, 
-                                                 ERAT#, 
-                                                 Project Name (link to status)
-                                                 NEBS PM]
-                """
-                if category == "NEBS":
+                tap_num = get_tap_number(sheet_entry["name"])
+
+                if ref_sheet is not None:
+                    """
+                    Using the ERAT number, retrieve data from NEBS master sheet
+                    results_data is list containing [Priority, 
+                                                     ERAT#, 
+                                                     Project Name (link to status)
+                                                     NEBS PM]
+                    """
                     results_data = erat_status(tap_num, ref_sheet, ref_column_map, category)
-            elif category == "SG":
-                results_data = sg_status(ss_client, sheet, category)
 
-            if results_data is not None:
-                # Skips any sheet that does not contain numbers.
-                # The purpose is to filter out the Status Template sheet.
-                if category == "NEBS":
-                    if re.compile('[0-9]').search(tap_num):
-                        # Retrieve data from inside the sheet
+                # The sheet name is already indexed, only download the sheets that will be reported.
+                if results_data is None:
+                    continue
+
+                if report_summary is not None:
+                    report_data = report_status(report_summary, i_sheet_id, "Standard Section No.", 2)
+                    if report_data is None:
+                        logger.debug("generate_dataframe_from_workspace: sheet {} not in report".format(i_sheet_id))
+                        if i_sheet_id in report_summary:
+                            report_misses += 1
+
+            cached_status = get_cached_status(sheet_entry)
+            if report_data is not None:
+                # Data aggregated from the report
+                complete, first_date, last_date = report_data
+            elif cached_status is not None:
+                # Sheet unchanged since the previous run
+                if category == "SG":
+                    results_data = list(cached_status["results"])
+                complete, first_date, last_date = cached_status["completion"]
+            else:
+                sheet = get_sheet_by_id(ss_client, i_sheet_id)
+                logger.debug("generate_dataframe_from_workspace: sheet.id = {}, sheet.name = {}".format(sheet.id, sheet.name))
+                if category == "SG":
+                    results_data = sg_status(ss_client, sheet, category)
+
+                if results_data is not None:
+                    # Skips any sheet that does not contain numbers.
+                    # The purpose is to filter out the Status Template sheet.
+                    if category == "NEBS":
+                        if re.compile('[0-9]').search(tap_num):
+                            # Retrieve data from inside the sheet
+                            first_date = first_test_date(ss_client, sheet)
+                            last_date = last_test_date(ss_client, sheet)
+                            complete = completion(ss_client, sheet, "Standard Section No.", 2)
+                    elif category == "SG":
+                        complete = completion(ss_client, sheet, "Standard Section", 4)
                         first_date = first_test_date(ss_client, sheet)
                         last_date = last_test_date(ss_client, sheet)
-                        complete = completion(ss_client, sheet, "Standard Section No.", 2)
-                elif category == "SG":
-                    complete = completion(ss_client, sheet, "Standard Section", 4)
-                    first_date = first_test_date(ss_client, sheet)
-                    last_date = last_test_date(ss_client, sheet)
 
+                    sheet_entry["status"] = {"version": sheet.version,
+                                             "results": list(results_data) if category == "SG" else None,
+                                             "completion": [complete, first_date, last_date]}
+
+            if results_data is not None:
                 results_data.insert(4, complete)
                 results_data.append(first_date)
                 results_data.append(last_date)
                 logger.debug(results_data)
 
                 data_set.append(results_data)  # for Dataframe
+
+    # The report covers these sheets but not their completion cell, the report is probably set up wrong.
+    if report_misses > 0:
+        logger.warning("generate_dataframe_from_workspace: no completion in the report for {} sheets, "
+                       "downloaded instead".format(report_misses))
     return data_set
 
 
@@ -630,7 +873,15 @@ def nebs():
     nebs_master_sheet = ss_client.Sheets.get_sheet(NEBS_STATUS_SHEET_ID, page_size=1000)
     ref_column_map = build_column_map(ss_client, nebs_master_sheet)
 
-    data_set = generate_dataframe_from_workspace(ss_client, NEBS_WORKSPACE_IDS, data_set, "NEBS", nebs_master_sheet, ref_column_map)
+    # Aggregate the project sheets from the report, sheets it does not cover are downloaded individually.
+    report_summary = None
+    if NEBS_REPORT_ID is not None:
+        report_summary = summarize_report(get_report_by_id(ss_client, NEBS_REPORT_ID))
+
+    sheet_index = build_sheet_index(ss_client, NEBS_WORKSPACE_IDS, NEBS_SHEET_INDEX_FILE)
+    data_set = generate_dataframe_from_workspace(ss_client, NEBS_WORKSPACE_IDS, data_set, "NEBS", nebs_master_sheet, ref_column_map,
+                                                 sheet_index=sheet_index, report_summary=report_summary)
+    save_sheet_index(sheet_index, NEBS_SHEET_INDEX_FILE)
 
     # Create Dataframe using the data_set and column headers
     results_head = get_excel_header()  # Get the excel column labels
@@ -653,7 +904,10 @@ def smartgrid():
     # Initialize client
     logger.info("Starting smartgrid()...")
     ss_client = smartsheet.Smartsheet(ACCESS_TOKEN)
-    data_set = generate_dataframe_from_workspace(ss_client, SG_WORKSPACE_IDS, data_set, category="SG")
+    sheet_index = build_sheet_index(ss_client, SG_WORKSPACE_IDS, SG_SHEET_INDEX_FILE)
+    data_set = generate_dataframe_from_workspace(ss_client, SG_WORKSPACE_IDS, data_set, category="SG",
+                                                 sheet_index=sheet_index)
+    save_sheet_index(sheet_index, SG_SHEET_INDEX_FILE)
 
     # Create Dataframe using the data_set and column headers
     results_head = get_excel_header()  # Get the excel column labels
@@ -0,0 +1,232 @@
+"""
+Tests for mysmart.py using local stand-in objects in place of the Smartsheet client.
+"""
+
+
+import json
+from types import SimpleNamespace
+
+import mysmart
+
+
+class StandInWorkspaces(object):
+    def __init__(self, members, names):
+        self.members = members  # workspace id -> list of sheet ids in listing order
+        self.names = names
+
+    def get_workspace(self, w_id, load_all=False, include=None):
+        assert not load_all
+        return SimpleNamespace(sheets=[SimpleNamespace(id=s_id, name=self.names[s_id], owner="pm@example.com")
+                                       for s_id in self.members.get(w_id, [])])
+
+
+class StandInSheets(object):
+    def __init__(self, listed):
+        self.listed = listed
+
+    def list_sheets(self, include=None, include_all=None):
+        return SimpleNamespace(data=self.listed)
+
+    def get_sheet(self, s_id, **kwargs):
+        raise AssertionError("sheet {} should not be downloaded".format(s_id))
+
+
+def stand_in_client(members, names, version=1):
+    listed = [SimpleNamespace(id=s_id, name=name, version=version, modified_at=None) for s_id, name in names.items()]
+    return SimpleNamespace(Workspaces=StandInWorkspaces(members, names), Sheets=StandInSheets(listed))
+
+
+def test_build_sheet_index_metadata():
+    # Workspace listing is by name, not by id.
+    client = stand_in_client({10: [2, 1]}, {1: "e6373: Tomahawk", 2: "Alpha", 3: "Other"})
+
+    index = mysmart.build_sheet_index(client, [10])
+
+    assert mysmart.get_sheets_from_index(index, 10) == [2, 1]
+    assert index["sheets"][1] == {"workspace_id": 10, "position": 1, "owner": "pm@example.com",
+                                  "name": "e6373: Tomahawk", "version": 1, "modified_at": None}
+    # Sheets outside of the requested workspaces are not indexed.
+    assert 3 not in index["sheets"]
+
+
+def test_build_sheet_index_saved(tmp_path):
+    path = str(tmp_path / "Results" / "sheet_index.json")
+    names = {1: "e6373: Tomahawk", 2: "e6759: Other"}
+    index = mysmart.build_sheet_index(stand_in_client({10: [1, 2]}, names), [10], path)
+    index["sheets"][1]["status"] = {"version": 1, "results": None, "completion": ["50%", "", ""]}
+    mysmart.save_sheet_index(index, path)
+
+    assert mysmart.load_sheet_index(path) == index
+
+    # Sheet 2 was moved to the archived workspace, it keeps its id.
+    index = mysmart.build_sheet_index(stand_in_client({10: [1], 20: [2]}, names), [10], path)
+
+    assert mysmart.get_sheets_from_index(index, 10) == [1]
+    assert mysmart.get_cached_status(index["sheets"][1])["completion"] == ["50%", "", ""]
+
+    index = mysmart.build_sheet_index(stand_in_client({10: [1]}, names, version=2), [10], path)
+
+    assert mysmart.get_cached_status(index["sheets"][1]) is None
+
+
+def test_load_sheet_index_malformed(tmp_path):
+    for saved in ([], {"sheets": []}, {"sheets": {"1": {"name": "x"}}}, {"sheets": {"1": "x"}},
+                  {"sheets": {"1": {"workspace_id": 10, "status": {"version": 1}}}}):
+        path = tmp_path / "sheet_index.json"
+        path.write_text(json.dumps(saved))
+        assert mysmart.load_sheet_index(str(path)) == {"sheets": {}}
+    assert mysmart.load_sheet_index(str(tmp_path / "missing.json")) == {"sheets": {}}
+
+
+class StandInRow(object):
+    def __init__(self, row_number, cells):
+        self.row_number = row_number
+        self.cells = cells
+
+    def get_column(self, column_id):
+        for cell in self.cells:
+            if cell.column_id == column_id:
+                return cell
+
+
+def stand_in_sheet(titles, rows):
+    """
+    Builds a Sheet-like object, rows is a list of dictionaries with column title as key.
+    """
+    columns = [SimpleNamespace(id=col_id, title=title) for col_id, title in enumerate(titles)]
+    sheet_rows = []
+    for row_number, values in enumerate(rows, 1):
+        cells = [SimpleNamespace(column_id=col.id, value=values[col.title], display_value=values[col.title])
+                 for col in columns if col.title in values]
+        sheet_rows.append(StandInRow(row_number, cells))
+    return SimpleNamespace(columns=columns, rows=sheet_rows)
+
+
+def stand_in_report_row(sheet_id, row_number, values):
+    cells = [SimpleNamespace(virtual_column_id=virtual_id, value=value, display_value=display)
+             for virtual_id, (value, display) in values.items()]
+    return SimpleNamespace(sheet_id=sheet_id, row_number=row_number, cells=cells)
+
+
+START, FINISH, SECTION = 100, 101, 102
+
+
+def stand_in_report():
+    """
+    Unsorted report, so each sheet's rows are together in the sheet's order.
+    Report row numbers are positions in the report, not row numbers in the project sheet.
+    """
+    columns = [SimpleNamespace(virtual_id=START, title="Start"),
+               SimpleNamespace(virtual_id=FINISH, title="Finish"),
+               SimpleNamespace(virtual_id=SECTION, title="Standard Section No.")]
+    rows = [stand_in_report_row(1, 1, {SECTION: ("No.", "No.")}),
+            stand_in_report_row(1, 2, {SECTION: (0.5, "50%")}),
+            stand_in_report_row(1, 3, {START: ("2017-09-14", None), FINISH: ("2017-10-01", None)}),
+            stand_in_report_row(1, 4, {START: ("2017-08-01", None), FINISH: ("2018-01-02T00:00:00", None)}),
+            stand_in_report_row(4, 5, {SECTION: ("No.", "No.")}),
+            stand_in_report_row(4, 6, {SECTION: (None, None)}),
+            # Sheet 2 only has its first row in the report.
+            stand_in_report_row(2, 7, {SECTION: ("No.", "No.")})]
+    return SimpleNamespace(columns=columns, rows=rows, total_row_count=len(rows))
+
+
+class StandInReports(object):
+    def __init__(self, report):
+        self.report = report
+        self.calls = 0
+
+    def get_report(self, report_id, page_size=None, page=None, include=None, level=None):
+        self.calls += 1
+        first = (page - 1) * page_size
+        return SimpleNamespace(columns=self.report.columns, rows=list(self.report.rows[first:first + page_size]),
+                               total_row_count=self.report.total_row_count)
+
+
+def test_get_report_by_id_all_pages():
+    reports = StandInReports(stand_in_report())
+    report = mysmart.get_report_by_id(SimpleNamespace(Reports=reports), 99, page_size=2)
+
+    assert reports.calls == 4
+    assert [row.row_number for row in report.rows] == [1, 2, 3, 4, 5, 6, 7]
+
+
+def test_report_status():
+    summary = mysmart.summarize_report(stand_in_report())
+
+    assert mysmart.report_status(summary, 1, "Standard Section No.", 2) == ["50%", "08/01/2017", "01/02/2018"]
+    assert mysmart.report_status(summary, 4, "Standard Section No.", 2) == ["0%", "", ""]
+    assert mysmart.report_status(summary, 1, "Standard Section", 2) is None
+    assert mysmart.report_status(summary, 2, "Standard Section No.", 2) is None
+    assert mysmart.report_status(summary, 3, "Standard Section No.", 2) is None
+
+
+def test_summarize_report_missing_rows():
+    report = stand_in_report()
+    report.rows = report.rows[:2]
+
+    assert mysmart.summarize_report(report) == {}
+
+
+def nebs_ref_sheet():
+    ref_titles = ["Priority", "ERAT#", "Project Name (link to status)", "NEBS PM"]
+    return stand_in_sheet(ref_titles, [dict(zip(ref_titles, ["1", "6373", "Tomahawk", "pm"])),
+                                       dict(zip(ref_titles, ["2", "6759", "Other", "pm"]))])
+
+
+def nebs_sheet_index():
+    return {"sheets": {1: {"workspace_id": 10, "position": 0, "name": "e6373: Tomahawk", "version": 1},
+                       2: {"workspace_id": 10, "position": 1, "name": "e6759: Other", "version": 1},
+                       3: {"workspace_id": 10, "position": 2, "name": "Status Template", "version": 1}}}
+
+
+def project_sheet_client(downloaded):
+    """
+    Stand-in client where every project sheet is the same 75% complete sheet.
+    """
+    project_sheet = stand_in_sheet(["Start", "Finish", "Standard Section No."],
+                                   [{"Standard Section No.": "No."},
+                                    {"Standard Section No.": "75%"},
+                                    {"Start": "2017-01-01", "Finish": "2017-02-01"}])
+
+    def get_sheet(s_id, **kwargs):
+        downloaded.append(s_id)
+        return SimpleNamespace(id=s_id, name="", version=1, columns=project_sheet.columns, rows=project_sheet.rows)
+
+    return SimpleNamespace(Sheets=SimpleNamespace(get_sheet=get_sheet))
+
+
+def test_generate_dataframe_from_report(caplog):
+    ref_sheet = nebs_ref_sheet()
+    downloaded = []
+    client = project_sheet_client(downloaded)
+
+    data_set = mysmart.generate_dataframe_from_workspace(client, [10], [], "NEBS", ref_sheet,
+                                                         mysmart.build_column_map(client, ref_sheet),
+                                                         sheet_index=nebs_sheet_index(),
+                                                         report_summary=mysmart.summarize_report(stand_in_report()))
+
+    # Sheet 2 is not fully in the report and is downloaded instead.
+    assert downloaded == [2]
+    assert [record.levelname for record in caplog.records if "no completion" in record.getMessage()] == ["WARNING"]
+    assert [row[4:5] + row[6:] for row in data_set] == [["50%", "08/01/2017", "01/02/2018"],
+                                                        ["75%", "01/01/2017", "02/01/2017"]]
+
+
+def test_generate_dataframe_cached_status():
+    ref_sheet = nebs_ref_sheet()
+    downloaded = []
+    client = project_sheet_client(downloaded)
+    index = nebs_sheet_index()
+
+    first_run = mysmart.generate_dataframe_from_workspace(client, [10], [], "NEBS", ref_sheet,
+                                                          mysmart.build_column_map(client, ref_sheet),
+                                                          sheet_index=index)
+    assert downloaded == [1, 2]
+
+    # Only the sheet whose version changed is downloaded again.
+    index["sheets"][2]["version"] = 2
+    second_run = mysmart.generate_dataframe_from_workspace(client, [10], [], "NEBS", ref_sheet,
+                                                           mysmart.build_column_map(client, ref_sheet),
+                                                           sheet_index=index)
+    assert downloaded == [1, 2, 2]
+    assert [row[4:] for row in second_run] == [row[4:] for row in first_run]